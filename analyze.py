@@ -0,0 +1,135 @@
+# stdlib
+import collections
+import contextlib
+import multiprocessing
+import random
+import sys
+import time
+from typing import Iterable, Tuple
+
+# local
+import gamerecord
+import gamestate
+from line import Line
+
+# Positions with fewer reachable cells than this are solved to judge pick_move. Reachable cells don't bound the game
+# tree, since moving an endpoint can bring new cells into reach, so each position's search is also capped at
+# NODE_LIMIT uncached positions and skipped if it runs over. Measured on random 4x4 and 5x5 games, a search of
+# NODE_LIMIT positions takes up to about a second and a half, and about 1 in 20 judged positions hit the cap.
+SOLVE_THRESHOLD = 8
+NODE_LIMIT = 500
+
+Blunder = collections.namedtuple('Blunder', ['game', 'turn', 'picked', 'best'])
+AnalysisReport = collections.namedtuple('AnalysisReport', ['games', 'positions', 'judged', 'blunders', 'skipped',
+                                                           'seconds', 'positions_per_second'])
+
+
+def analyze_game(record: gamerecord.GameRecord, game_index: int = 0, seed: int = 0,
+                 solve_threshold: int = SOLVE_THRESHOLD, node_limit: int = NODE_LIMIT) -> Tuple[int, list, int]:
+    """
+    Replays a recorded game and asks pick_move for a move at every position along the way, with the same settings
+    as live play, so its own endgame search is bounded by the board's node_limit.
+
+    Positions where pick_move played from its heuristic and fewer than solve_threshold cells can be reached are
+    judged: pick_move's choice is checked against the solver, and choosing a losing move from a won position is a
+    blunder. That is the band from game.endgame_threshold up to solve_threshold, since below endgame_threshold
+    pick_move already plays the solver's move. Positions where pick_move abandoned its own search, or where a check
+    runs past node_limit, are skipped instead.
+
+    :param record: The game to replay
+    :param game_index: The index of the game in its batch, used for reporting and to seed the random number generator
+    :param seed: The base seed for pick_move's random choices
+    :param solve_threshold: Positions with fewer reachable cells than this are judged
+    :param node_limit: The most positions one check may search before the position is skipped, or None for no limit
+    :return: The number of positions evaluated, the number judged, a list of Blunders and the number skipped
+    """
+    rng = random.Random(seed + game_index)  # the same batch and seed always give the same report
+    game = gamestate.HoldThatLine(record.height, record.width)
+    positions = 0
+    judged = 0
+    blunders = []
+    skipped = 0
+    for turn, (start, end) in enumerate(record.moves, start=1):
+        moves = game.generate_moves()
+        abandoned = game.searches_abandoned
+        picked = game.pick_move(rng, moves)
+        positions += 1
+
+        # the opening can't be solved, and a position with no moves has nothing to judge
+        if game.endpoints is not None and picked is not None:
+            reachable = len(game.reachable_cells(moves))
+            if game.searches_abandoned > abandoned:
+                skipped += 1
+            elif game.endgame_threshold <= reachable < solve_threshold:
+                try:
+                    # a move that leaves the opponent in a won position throws away a win
+                    if game.solve(node_limit) and game.simulate_move(picked).solve(node_limit):
+                        best = game.solve_move(moves, rng, node_limit)
+                        blunders.append(Blunder(game_index, turn, (picked.start, picked.end),
+                                                (best.start, best.end)))
+                    judged += 1
+                except gamestate.SearchLimitExceeded:
+                    skipped += 1
+
+        move = Line(start, end)
+        if not game.make_move(move):
+            raise ValueError(f'Illegal move {start}, {end} on turn {turn} of game {game_index}.')
+    return positions, judged, blunders, skipped
+
+
+def _analyze_game_star(args: tuple) -> Tuple[int, int, list, int]:
+    """
+    Unpacks arguments for analyze_game, since Pool.imap only passes one
+
+    :param args: A tuple of analyze_game's arguments
+    :return: The result of analyze_game
+    """
+    return analyze_game(*args)
+
+
+def analyze_records(records: Iterable[gamerecord.GameRecord], processes: int = None, seed: int = 0,
+                    solve_threshold: int = SOLVE_THRESHOLD, node_limit: int = NODE_LIMIT,
+                    chunksize: int = 1) -> AnalysisReport:
+    """
+    Analyzes many recorded games across a pool of worker processes. Records are consumed lazily, so a RecordReader
+    can be passed in directly.
+
+    :param records: The games to analyze
+    :param processes: The number of worker processes, defaulting to the number of CPUs. 1 runs in this process.
+    :param seed: The base seed for pick_move's random choices
+    :param solve_threshold: Positions with fewer reachable cells than this are judged, see analyze_game
+    :param node_limit: The most positions one check may search before the position is skipped, or None for no limit
+    :param chunksize: The number of games handed to a worker at a time. Games take long enough to analyze that
+        handing them out one by one costs little and keeps every worker busy.
+    :return: An AnalysisReport covering every game
+    """
+    jobs = ((record, i, seed, solve_threshold, node_limit) for i, record in enumerate(records))
+    games = 0
+    positions = 0
+    judged = 0
+    blunders = []
+    skipped = 0
+
+    start = time.perf_counter()
+    with contextlib.nullcontext() if processes == 1 else multiprocessing.Pool(processes) as pool:
+        results = map(_analyze_game_star, jobs) if pool is None else pool.imap(_analyze_game_star, jobs, chunksize)
+        for game_positions, game_judged, game_blunders, game_skipped in results:
+            games += 1
+            positions += game_positions
+            judged += game_judged
+            blunders.extend(game_blunders)
+            skipped += game_skipped
+    seconds = time.perf_counter() - start
+
+    return AnalysisReport(games, positions, judged, blunders, skipped, seconds, positions / seconds if seconds else 0.0)
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        with open(path, 'rb') as f:
+            report = analyze_records(gamerecord.RecordReader(f))
+        print(f'{path}: {report.games} games, {report.positions} positions, {report.judged} judged, '
+              f'{len(report.blunders)} blunders, {report.skipped} skipped, '
+              f'{report.positions_per_second:.1f} positions/s')
+        for blunder in report.blunders:
+            print(f'  game {blunder.game} turn {blunder.turn}: played {blunder.picked}, best was {blunder.best}')
@@ -0,0 +1,171 @@
+"""
+Compact binary storage for Hold-That-Line games.
+
+A file is a stream of records laid out back to back. Each record is a header followed by its packed moves:
+
+    header: magic b'HT', height (uint8), width (uint8), number of moves (uint16), all big-endian
+    moves:  one unsigned integer per move, the narrowest of 1, 2 or 4 bytes that fits every code on the board
+
+Cells are numbered row by row, so (y, x) is cell y * width + x. The opening move is stored as two cell indices,
+start then end. Every later move has to start from one of the two current endpoints, so it is stored as a single
+code, end * 2 + i, where i is the index of the endpoint it was drawn from.
+"""
+
+# stdlib
+import collections
+import re
+import struct
+from ast import literal_eval
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+MAGIC = b'HT'
+HEADER = struct.Struct('>2sBBH')
+
+GameRecord = collections.namedtuple('GameRecord', ['height', 'width', 'moves'])
+
+
+def parse_move(move_str: str) -> Tuple[tuple, tuple]:
+    """
+    Parses a move string in the server's format, e.g. '(0, 1),(2, 3)'
+
+    :param move_str: The move as sent by the game server
+    :return: The start and end coordinates of the move
+    """
+    start, end = (literal_eval(x) for x in re.match(r'^([^,]*,[^,]*),(.*)$', move_str).groups())
+    return start, end
+
+
+def record_from_history(height: int, width: int, history: List[dict]) -> GameRecord:
+    """
+    Builds a record from the JSON move history returned by the game server.
+
+    :param height: The height of the board
+    :param width: The width of the board
+    :param history: A list of dicts with 'turn' and 'move' keys
+    :return: The game as a GameRecord
+    """
+    moves = [parse_move(turn['move']) for turn in sorted(history, key=lambda x: x['turn'])]
+    return GameRecord(height, width, moves)
+
+
+def _move_format(height: int, width: int) -> struct.Struct:
+    """
+    Picks the narrowest integer type that can hold every move code on a board.
+
+    :param height: The height of the board
+    :param width: The width of the board
+    :return: A Struct packing a single move code
+    """
+    num_codes = height * width * 2
+    if num_codes <= 0x100:
+        return struct.Struct('>B')
+    elif num_codes <= 0x10000:
+        return struct.Struct('>H')
+    else:
+        return struct.Struct('>I')
+
+
+class RecordWriter:
+    """Writes GameRecords to a binary file object one at a time"""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+
+    def write(self, record: GameRecord) -> None:
+        """
+        Packs a record and writes it to the stream.
+
+        :param record: The game to write
+        :return: None
+        """
+        height, width, moves = record
+        if not 0 < height < 256 or not 0 < width < 256:
+            raise ValueError(f'Invalid board dimensions {height}, {width}. Both must be between 1 and 255.')
+        if len(moves) > 0xFFFF:
+            raise ValueError(f'Cannot store a game of {len(moves)} moves.')
+
+        codes = []
+        endpoints = None
+        for start, end in moves:
+            for coord in start, end:
+                if not (0 <= coord[0] < height and 0 <= coord[1] < width):
+                    raise ValueError(f'Invalid move {start}, {end}. Coordinate {coord} is off the board.')
+            if endpoints is None:
+                codes.extend([start[0] * width + start[1], end[0] * width + end[1]])
+                endpoints = [start, end]
+            else:
+                if start not in endpoints:
+                    raise ValueError(f'Invalid move {start}, {end}. Moves must start from an endpoint {endpoints}.')
+                i = endpoints.index(start)
+                codes.append((end[0] * width + end[1]) * 2 + i)
+                endpoints[i] = end
+
+        move_format = _move_format(height, width)
+        self.stream.write(HEADER.pack(MAGIC, height, width, len(moves)))
+        self.stream.write(b''.join(move_format.pack(code) for code in codes))
+
+    def write_all(self, records: Iterable[GameRecord]) -> int:
+        """
+        Writes every record from an iterable.
+
+        :param records: The games to write
+        :return: The number of records written
+        """
+        count = 0
+        for record in records:
+            self.write(record)
+            count += 1
+        return count
+
+
+class RecordReader:
+    """Lazily reads GameRecords from a binary file object. Iterate over it to stream the records."""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+
+    def __iter__(self) -> Iterator[GameRecord]:
+        while True:
+            record = self.read()
+            if record is None:
+                return
+            yield record
+
+    def read(self) -> Optional[GameRecord]:
+        """
+        Reads the next record from the stream.
+
+        :return: The next GameRecord, or None at the end of the stream
+        """
+        header = self.stream.read(HEADER.size)
+        if not header:
+            return None
+        if len(header) < HEADER.size:
+            raise ValueError('Truncated record header.')
+        magic, height, width, num_moves = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f'Invalid record magic {magic!r}.')
+
+        move_format = _move_format(height, width)
+        num_codes = num_moves + 1 if num_moves else 0  # the opening move takes two codes
+        body = self.stream.read(num_codes * move_format.size)
+        if len(body) < num_codes * move_format.size:
+            raise ValueError('Truncated record body.')
+        codes = [code for (code,) in move_format.iter_unpack(body)]
+
+        # a corrupted body could decode to cells off the board, which the writer would never have produced
+        num_cells = height * width
+        for cell in codes[:2] + [code // 2 for code in codes[2:]]:
+            if cell >= num_cells:
+                raise ValueError(f'Invalid cell index {cell} on a {height}x{width} board.')
+
+        moves = []
+        if codes:
+            endpoints = [divmod(codes[0], width), divmod(codes[1], width)]
+            moves.append(tuple(endpoints))
+            for code in codes[2:]:
+                i = code % 2
+                end = divmod(code // 2, width)
+                moves.append((endpoints[i], end))
+                endpoints[i] = end
+        return GameRecord(height, width, moves)
@@ -1,4 +1,5 @@
 # stdlib
+import collections
 import itertools
 import random
 import fractions
@@ -8,13 +9,34 @@ from typing import List, Union
 from line import Line
 
 
+class SearchLimitExceeded(Exception):
+    """Raised when an exhaustive search has to visit more positions than it was allowed to"""
+
+
 class HoldThatLine:
 
-    def __init__(self, height, width):
+    # pick_move solves the game exactly once fewer than this many distinct cells can be reached
+    ENDGAME_THRESHOLD = 5
+    # the most uncached positions pick_move will search before falling back to predict_wins_and_losses
+    ENDGAME_NODE_LIMIT = 50
+    # the most solved positions we remember between turns of a match
+    SOLVER_CACHE_SIZE = 50000
+    # the most intersection results a collision table holds before it is cleared and starts over
+    COLLISION_TABLE_SIZE = 200000
+
+    def __init__(self, height, width, endgame_threshold=ENDGAME_THRESHOLD, cache_size=SOLVER_CACHE_SIZE,
+                 node_limit=ENDGAME_NODE_LIMIT):
         self.height = height
         self.width = width
         self.endpoints = None
         self.lines = []
+        self.endgame_threshold = endgame_threshold
+        self.cache_size = cache_size
+        self.node_limit = node_limit
+        self.searches_abandoned = 0  # how many times pick_move's endgame search ran past node_limit
+        self.solved = collections.OrderedDict()  # position key -> True if the player to move wins
+        self.line_table = None  # (start, end) -> Line, shared across a batch by pick_moves
+        self.collision_table = None  # (move start, move end, line start, line end) -> intersection result
 
     def generate_moves(self) -> List[Line]:
         """
@@ -28,7 +50,7 @@ class HoldThatLine:
             end = None
             coords = itertools.product(range(self.height), range(self.width))
             possible_lines = itertools.combinations(coords, r=2)
-            return [Line(l[0], l[1]) for l in possible_lines]
+            return [self._line(l[0], l[1]) for l in possible_lines]
 
         moves = []
         # iterate through each endpoint and every legal destination on the board
@@ -37,8 +59,9 @@ class HoldThatLine:
                 for j in range(self.width):
                     coord = (i, j)
                     if coord != endpoint:  # no zero-dimensional "lines"
-                        temp_line = Line(endpoint, coord)
-                        if self.check_move(temp_line):  # check if move is legal
+                        temp_line = self._line(endpoint, coord)
+                        # candidates are on the board and drawn from an endpoint, so only intersections need checking
+                        if self._is_clear(temp_line):
                             moves.append(temp_line)  # if so, save it
         return moves
 
@@ -66,9 +89,26 @@ class HoldThatLine:
             if not from_endpoint:
                 return False
 
+        return self._is_clear(move)
+
+    def _is_clear(self, move: Line) -> bool:
+        """
+        Checks if a potential move avoids every line on the board, consulting self.collision_table when one is set
+
+        :param move: The Line object being checked
+        :return: True if the move does not intersect with any lines, else False
+        """
         # does it intersect with any line at any point besides the endpoint its drawn from?
         for line in self.lines:
-            intersect = move.check_intersection(line)  # does our move intersect with the line?
+            if self.collision_table is None:
+                intersect = move.check_intersection(line)  # does our move intersect with the line?
+            else:
+                key = (move.start, move.end, line.start, line.end)
+                intersect = self.collision_table.get(key)
+                if intersect is None:
+                    if len(self.collision_table) >= self.COLLISION_TABLE_SIZE:
+                        self.collision_table.clear()
+                    intersect = self.collision_table[key] = move.check_intersection(line)
             if intersect:
                 return False  # if so, return False
         return True  # if not, return True
@@ -87,23 +127,11 @@ class HoldThatLine:
         # Iterate through every move
         for move in moves:
             # For each move, we simulate a temporary board state in which the move has been made
-            temp_board = HoldThatLine(self.height, self.width)
-            temp_lines = self.lines.copy()
-            temp_endpoints = self.endpoints.copy() if self.endpoints else None
-            temp_board.lines = temp_lines
-            temp_board.endpoints = temp_endpoints
-            temp_board.make_move(move)
+            temp_board = self.simulate_move(move)
 
             # Figure out the number of moves left in the game
-            seen = set()
-            look_ahead = temp_board.generate_moves()
-            look_ahead_clean = []
-            for temp_move in look_ahead:
-                # We are concerned with the number of spaces left to move to, so filter duplicates
-                if temp_move.end not in seen:
-                    seen.add(temp_move.end)
-                    look_ahead_clean.append(temp_move)
-            num_look_ahead = len(look_ahead_clean)
+            # We are concerned with the number of spaces left to move to, so duplicates are filtered
+            num_look_ahead = len(self.reachable_cells(temp_board.generate_moves()))
 
             # if our potential move leaves only one space to move to afterward, its likely a win
             if num_look_ahead == 1:
@@ -112,14 +140,101 @@ class HoldThatLine:
             elif num_look_ahead in [0, 2]:
                 losses.append(move)
 
-    def pick_move(self) -> Union[Line, None]:
+    @staticmethod
+    def reachable_cells(moves: List[Line]) -> set:
         """
-        Randomly chooses a legal move, filtering where possible to avoid probable losses and take probable wins.
+        Collects the distinct cells that a list of moves can end on.
+
+        :param moves: The list of moves (Lines) to inspect
+        :return: A set of destination coordinates
+        """
+        return {move.end for move in moves}
+
+    def solve(self, node_limit: int = None) -> bool:
+        """
+        Searches the remainder of the game exhaustively to determine whether the player to move can force a win.
+        Solved positions are memoized in self.solved, which holds at most self.cache_size entries and is shared with
+        every board simulated from this one, so work done on earlier turns of a match is reused on later ones.
+
+        Only practical in the endgame - the tree grows very quickly with the number of reachable cells, and moving an
+        endpoint can bring new cells into reach, so callers that can't afford an unbounded search should set a limit.
+        Positions solved before the limit is hit stay cached.
+
+        :param node_limit: The most positions to search that aren't already cached, or None for no limit
+        :return: True if the player to move wins with perfect play, else False
+        :raises SearchLimitExceeded: If the search needs more than node_limit positions
+        """
+        return self._solve(None if node_limit is None else [node_limit])
+
+    def _solve(self, budget: Union[List[int], None]) -> bool:
+        """
+        Does the work of solve, sharing one budget across the whole search
+
+        :param budget: A single-item list holding the number of positions left to search, or None for no limit
+        :return: True if the player to move wins with perfect play, else False
+        """
+        key = self._position_key()
+        if key in self.solved:
+            self.solved.move_to_end(key)
+            return self.solved[key]
+
+        if budget is not None:
+            budget[0] -= 1
+            if budget[0] < 0:
+                raise SearchLimitExceeded()
+
+        # a player who cannot move has won; otherwise we win if some move leaves the opponent in a lost position
+        moves = self.generate_moves()
+        win = not moves or any(not self.simulate_move(move)._solve(budget) for move in moves)
+
+        # remember the result, evicting the least recently used position if we are full
+        self.solved[key] = win
+        if len(self.solved) > self.cache_size:
+            self.solved.popitem(last=False)
+        return win
+
+    def solve_move(self, moves: List[Line] = None, rng: random.Random = random,
+                   node_limit: int = None) -> Union[Line, None]:
+        """
+        Chooses a provably best move by solving the rest of the game. If a winning move exists one is chosen at random,
+        otherwise every move loses against perfect play and any of them is chosen at random.
         If no moves can be made, return None.
 
+        :param moves: The legal moves on the current board, if they have already been generated
+        :param rng: The source of random choices, the random module by default
+        :param node_limit: The most positions to search that aren't already cached, or None for no limit
+        :return: The chosen move, or None if no move can be made
+        :raises SearchLimitExceeded: If the search needs more than node_limit positions
+        """
+        if moves is None:
+            moves = self.generate_moves()
+        if not moves:
+            return None
+
+        budget = None if node_limit is None else [node_limit]
+        winning = [move for move in moves if not self.simulate_move(move)._solve(budget)]
+        return rng.choice(winning if winning else moves)
+
+    def pick_move(self, rng: random.Random = random, moves: List[Line] = None) -> Union[Line, None]:
+        """
+        Randomly chooses a legal move, filtering where possible to avoid probable losses and take probable wins.
+        Once fewer than self.endgame_threshold cells can be reached, the game is instead solved exactly, unless that
+        takes more than self.node_limit positions, in which case the search is abandoned for the usual filtering.
+        Positions solved before giving up stay cached for later turns. If no moves can be made, return None.
+
+        :param rng: The source of random choices, the random module by default
+        :param moves: The legal moves on the current board, if they have already been generated
         :return: The chosen move, or None if no move can be made
         """
-        moves = self.generate_moves()  # generate all possible, legal moves
+        if moves is None:
+            moves = self.generate_moves()  # generate all possible, legal moves
+
+        # late in the game the tree is usually small enough to search to the end
+        if self.endpoints is not None and len(self.reachable_cells(moves)) < self.endgame_threshold:
+            try:
+                return self.solve_move(moves, rng, self.node_limit)
+            except SearchLimitExceeded:
+                self.searches_abandoned += 1
 
         # predict wins and losses
         wins = []
@@ -128,42 +243,120 @@ class HoldThatLine:
 
         # If there is a possible win, take it every time
         if wins:
-            return random.choice(wins)  # there may be more than one, in which case the choice is random
+            return rng.choice(wins)  # there may be more than one, in which case the choice is random
         else:
             # if there are losses and not all next moves are losses, filter out the losses
             # if all next moves are losses, no filtering occurs
             if losses:
                 if len(losses) != len(moves):
+                    # keep the generated order so that seeded random play is reproducible
                     loss_set = set(losses)
-                    move_set = set(moves)
-                    moves = list(move_set - loss_set)
+                    moves = [move for move in moves if move not in loss_set]
 
             # make a random choice after loss filtering
             # early in a game, this is effectively random play
             if moves:
-                return random.choice(moves)
+                return rng.choice(moves)
             # if there are no moves to make, return None
             else:
                 return None
 
     def make_move(self, move: Line) -> bool:
         if self.check_move(move):
-            if self.endpoints is None:
-                midpoint = (fractions.Fraction((move.start[0] + move.end[0]) / 2),
-                            fractions.Fraction((move.start[1] + move.end[1]) / 2))
-                for point in move.start, move.end:
-                    half_move = Line(midpoint, point)
-                    self.lines.append(half_move)
-                self.endpoints = [move.start, move.end]
-            else:
-                self.lines.append(move)
-                for i in range(2):
-                    if self.endpoints[i] == move.start:
-                        self.endpoints[i] = move.end
+            self._apply_move(move)
             return True
         else:
             return False
 
+    def _apply_move(self, move: Line) -> None:
+        """
+        Updates lines and endpoints for a move. The move is assumed to be legal.
+
+        :param move: The Line being played
+        :return: None
+        """
+        if self.endpoints is None:
+            midpoint = (fractions.Fraction((move.start[0] + move.end[0]) / 2),
+                        fractions.Fraction((move.start[1] + move.end[1]) / 2))
+            for point in move.start, move.end:
+                half_move = Line(midpoint, point)
+                self.lines.append(half_move)
+            self.endpoints = [move.start, move.end]
+        else:
+            self.lines.append(move)
+            for i in range(2):
+                if self.endpoints[i] == move.start:
+                    self.endpoints[i] = move.end
+
+    def simulate_move(self, move: Line) -> 'HoldThatLine':
+        """
+        Simulates the board that results from a legal move without modifying this one. The solver cache and lookup
+        tables are shared.
+
+        :param move: The Line being played
+        :return: A new HoldThatLine with the move made
+        """
+        temp_board = HoldThatLine(self.height, self.width, self.endgame_threshold, self.cache_size, self.node_limit)
+        temp_board.lines = self.lines.copy()
+        temp_board.endpoints = self.endpoints.copy() if self.endpoints else None
+        temp_board.solved = self.solved
+        temp_board.line_table = self.line_table
+        temp_board.collision_table = self.collision_table
+        temp_board._apply_move(move)
+        return temp_board
+
+    def _line(self, start: tuple, end: tuple) -> Line:
+        """
+        Builds a Line, reusing the one in self.line_table when one is set
+
+        :param start: The starting coordinate
+        :param end: The ending coordinate
+        :return: The Line from start to end
+        """
+        if self.line_table is None:
+            return Line(start, end)
+        line = self.line_table.get((start, end))
+        if line is None:
+            line = self.line_table[(start, end)] = Line(start, end)
+        return line
+
+    def _position_key(self) -> tuple:
+        """
+        Builds a hashable key identifying the current position for the solver cache.
+
+        :return: A tuple of the endpoints and drawn lines, both order-independent
+        """
+        return frozenset(self.endpoints or ()), frozenset((line.start, line.end) for line in self.lines)
+
+
+def pick_moves(games: List[HoldThatLine], seed: int = None) -> List[Union[Line, None]]:
+    """
+    Picks a move for each of many boards at once. Boards of the same size share candidate Lines and the results of
+    intersection checks for the duration of the batch, so positions that have lines in common (different turns of one
+    game, games with the same opening) only pay for them once. Each board keeps solving into its own cache, so what
+    one match learns carries over to its later turns without crowding out other matches.
+
+    Most of the gain comes from not repeating intersection checks; the boards are still visited one at a time. The
+    line table holds at most one Line per pair of cells on each board size, and a collision table is cleared whenever
+    it reaches HoldThatLine.COLLISION_TABLE_SIZE entries, which bounds memory for large batches on big boards.
+
+    With a seed, games[i] is given the same move as games[i].pick_move(random.Random(seed + i)) would give it.
+
+    :param games: The boards to pick moves for
+    :param seed: The seed for random choices, or None to use the random module
+    :return: A list with the chosen move, or None if no move can be made, for each board
+    """
+    tables = {}
+    picks = []
+    for i, game in enumerate(games):
+        saved = game.line_table, game.collision_table
+        game.line_table, game.collision_table = tables.setdefault((game.height, game.width), ({}, {}))
+        try:
+            picks.append(game.pick_move(random if seed is None else random.Random(seed + i)))
+        finally:
+            game.line_table, game.collision_table = saved
+    return picks
+
 
 if __name__ == '__main__':
     pass
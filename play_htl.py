@@ -1,13 +1,12 @@
 # local
+import gamerecord
 import gamestate
 import json
 import line
-import re
 import requests
 import docopt
 
 from time import sleep
-from ast import literal_eval
 
 
 class Opponent:
@@ -88,7 +87,7 @@ class NetworkOpponent:
                     history = sorted(result['history'], key=lambda x: x['turn'], reverse=True)
                     if history:
                         prev_move = history[0]['move']
-                        start, end = (literal_eval(x) for x in re.match(r'^((?:[^,]*,){%d}[^,]*),(.*)' % 1, prev_move).groups())
+                        start, end = gamerecord.parse_move(prev_move)
                         move = line.Line(start, end)
                         print(f'Opponent Last Move : {(start, end)}')
                         return move
@@ -223,7 +222,7 @@ class HumanOpponent(Opponent):
             while True:
                 try:
                     move_input = input('Enter move points (comma-separated - (x1,y1),(x2,y2)): ')
-                    start, end = (literal_eval(x) for x in re.match(r'^((?:[^,]*,){%d}[^,]*),(.*)' % 1, move_input).groups())
+                    start, end = gamerecord.parse_move(move_input)
                     if isinstance(start, tuple) and isinstance(end, tuple):  # isinstance
                         if game.endpoints is not None:
                             if start not in game.endpoints:
@@ -301,8 +300,7 @@ def main(mode='human', **kwargs):
         game_history = opponent.fetch_game_history()  # this will now block until the game has actually started
         if game_history:
             for move in sorted(game_history, key=lambda x: x['turn']):
-                start, end = (literal_eval(x) for x in
-                              re.match(r'^((?:[^,]*,){%d}[^,]*),(.*)' % 1, move['move']).groups())
+                start, end = gamerecord.parse_move(move['move'])
                 move = line.Line(start, end)
                 game.make_move(move)
                 opponent.turn += 1